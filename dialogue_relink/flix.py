@@ -3,16 +3,45 @@
 #
 
 import base64
-import binascii
+import concurrent.futures
 import hashlib
 import hmac
 import json
+import threading
 import time
 import requests
+import urllib3
 
-from collections import OrderedDict
-from datetime import datetime, timedelta
-from typing import Callable, Dict, List, Tuple, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from datetime import datetime, timezone
+from email.utils import formatdate
+from operator import itemgetter
+from typing import Dict, List, Tuple, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pybase64 as _b64
+except ImportError:
+    _b64 = base64
+
+_loads = orjson.loads if orjson else json.loads
+
+
+def _dumps(content: object) -> bytes:
+    if orjson:
+        return orjson.dumps(content)
+    return json.dumps(content).encode('utf-8')
+
+
+_revision_fields = itemgetter('duration', 'panel_id', 'revision_number')
+
+# Requests are made with verify=False, do not warn about it on every call
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
 class flix:
@@ -36,17 +65,22 @@ class flix:
         Returns:
             Dict -- Authenticate
         """
-        authdata = base64.b64encode((login + ':' + password).encode('UTF-8'))
+        if self._basic_auth_credentials != (login, password):
+            authdata = _b64.b64encode((login + ':' + password).encode('UTF-8'))
+            self._basic_auth_header = 'Basic ' + authdata.decode('UTF-8')
+            self._basic_auth_credentials = (login, password)
         response = None
         header = {
             'Content-Type': 'application/json',
-            'Authorization': 'Basic ' + authdata.decode('UTF-8'),
+            'Authorization': self._basic_auth_header,
         }
         try:
-            r = requests.post(hostname + '/authenticate', headers=header,
-                              verify=False)
+            r = self._session.post(hostname + '/authenticate', headers=header)
             r.raise_for_status()
-            response = json.loads(r.content)
+            response = _loads(r.content)
+            if (hostname, login) != (self.hostname, self.login):
+                # Cached responses belong to the previous server or user
+                self._get_cache.clear()
             self.hostname = hostname
             self.login = login
             self.password = password
@@ -56,8 +90,12 @@ class flix:
 
         self.key = response['id']
         self.secret = response['secret_access_key']
-        self.expiry = datetime.strptime(
-            response['expiry_date'].split('.')[0], '%Y-%m-%dT%H:%M:%S')
+        # Key and secret are replaced together so readers never mix tokens
+        self._token = (self.key, self.secret)
+        self.expiry = datetime.fromisoformat(response['expiry_date'][:19])
+        # Refresh the token two hours before it expires
+        self._refresh_after = self.expiry.replace(
+            tzinfo=timezone.utc).timestamp() - 7200
         return response
 
     def __get_token(self) -> Tuple[str, str]:
@@ -67,28 +105,26 @@ class flix:
         Returns:
             Tuple[str, str] -- Key and Secret
         """
-        if (self.key is None or self.secret is None or self.expiry is None or
-                datetime.now() + timedelta(hours=2) > self.expiry):
-            authentificationToken = self.authenticate(
-                self.hostname, self.login, self.password)
-            auth_id = authentificationToken['id']
-            auth_secret_token = authentificationToken['secret_access_key']
-            auth_expiry_date = authentificationToken['expiry_date']
-            auth_expiry_date = auth_expiry_date.split('.')[0]
-            self.key = auth_id
-            self.secret = auth_secret_token
-            self.expiry = datetime.strptime(auth_expiry_date,
-                                            '%Y-%m-%dT%H:%M:%S')
-        return self.key, self.secret
+        token = self._token
+        if token is not None and time.time() < self._refresh_after:
+            return token
+        with self._token_lock:
+            # Another thread may have refreshed the token while we waited
+            if self._token is None or time.time() >= self._refresh_after:
+                self.authenticate(self.hostname, self.login, self.password)
+            token = self._token
+        if token is None:
+            return None, None
+        return token
 
     def __fn_sign(self,
                   access_key_id: str,
                   secret_access_key: str,
-                  url: str,
-                  content: object,
+                  url_path: str,
+                  content_md5: str,
                   http_method: str,
                   content_type: str,
-                  dt: str) -> str:
+                  dt: datetime) -> str:
         """After being logged in, you will have a token.
 
         Arguments:
@@ -96,15 +132,72 @@ class flix:
 
             secret_access_key {str} -- Secret access key from your token
 
-            url {str} -- Url of the request
+            url_path {str} -- Url of the request without query parameters
 
-            content {object} -- Content of your request
+            content_md5 {str} -- Hex MD5 digest of the request body, empty
+            if there is no body
 
             http_method {str} -- Http Method of your request
 
             content_type {str} -- Content Type of your request
 
-            dt {str} -- Datetime
+            dt {datetime} -- UTC datetime of the request
+
+        Raises:
+            ValueError: 'You must specify a secret_access_key'
+
+        Returns:
+            str -- Signed header
+        """
+        raw_string = '\n'.join([
+            http_method.upper(),
+            content_md5,
+            content_type if content_md5 else '',
+            dt.isoformat(timespec='seconds') + 'Z',
+            url_path,
+        ])
+        return self.__sign_raw_string(
+            access_key_id, secret_access_key, raw_string)
+
+    def __fn_sign_get(self,
+                      access_key_id: str,
+                      secret_access_key: str,
+                      url_path: str,
+                      dt: datetime) -> str:
+        """__fn_sign_get signs a GET request without content
+
+        Arguments:
+            access_key_id {str} -- Access key ID from your token
+
+            secret_access_key {str} -- Secret access key from your token
+
+            url_path {str} -- Url of the request without query parameters
+
+            dt {datetime} -- UTC datetime of the request
+
+        Raises:
+            ValueError: 'You must specify a secret_access_key'
+
+        Returns:
+            str -- Signed header
+        """
+        return self.__sign_raw_string(
+            access_key_id, secret_access_key,
+            f"GET\n\n\n{dt.isoformat(timespec='seconds')}Z\n{url_path}")
+
+    def __sign_raw_string(self,
+                          access_key_id: str,
+                          secret_access_key: str,
+                          raw_string: str) -> str:
+        """__sign_raw_string signs the canonical string of a request
+        with the secret access key
+
+        Arguments:
+            access_key_id {str} -- Access key ID from your token
+
+            secret_access_key {str} -- Secret access key from your token
+
+            raw_string {str} -- Canonical string of the request
 
         Raises:
             ValueError: 'You must specify a secret_access_key'
@@ -112,42 +205,29 @@ class flix:
         Returns:
             str -- Signed header
         """
-        raw_string = http_method.upper() + '\n'
-        content_md5 = ''
-        if content:
-            if isinstance(content, str):
-                content_md5 = hashlib.md5(content).hexdigest()
-            elif isinstance(content, bytes):
-                hx = binascii.hexlify(content)
-                content_md5 = hashlib.md5(hx).hexdigest()
-            elif isinstance(content, dict):
-                jsoned = json.dumps(content)
-                content_md5 = hashlib.md5(jsoned.encode('utf-8')).hexdigest()
-        if content_md5 != '':
-            raw_string += content_md5 + '\n'
-            raw_string += content_type + '\n'
-        else:
-            raw_string += '\n\n'
-        raw_string += dt.isoformat().split('.')[0] + 'Z' + '\n'
-        url_bits = url.split('?')
-        url_without_query_params = url_bits[0]
-        raw_string += url_without_query_params
         if len(secret_access_key) == 0:
             raise ValueError('You must specify a secret_access_key')
-        digest_created = base64.b64encode(
-            hmac.new(secret_access_key.encode('utf-8'),
-                     raw_string.encode('utf-8'),
-                     digestmod=hashlib.sha256).digest()
-        )
+        # Read and replace the cache as one tuple so concurrent signers
+        # never pair a secret with another secret's template
+        cache = self._hmac_cache
+        if cache is None or cache[0] != secret_access_key:
+            cache = (secret_access_key,
+                     hmac.new(secret_access_key.encode('utf-8'),
+                              digestmod='sha256'))
+            self._hmac_cache = cache
+        signer = cache[1].copy()
+        signer.update(raw_string.encode('utf-8'))
+        digest_created = _b64.b64encode(signer.digest())
         return 'FNAUTH ' + access_key_id + ':' + digest_created.decode('utf-8')
 
     def __get_headers(
-            self, content: object, url: str, method: str = 'POST') -> object:
+            self, body: Optional[bytes], url: str,
+            method: str = 'POST') -> object:
         """__get_headers will generate the header to make any request
         containing the authorization with signature
 
         Arguments:
-            content {object} -- Content of the request
+            body {Optional[bytes]} -- Serialized body of the request
 
             url {str} -- Url to make the request
 
@@ -156,21 +236,70 @@ class flix:
         Returns:
             object -- Headers
         """
-        dt = datetime.utcnow()
+        now = time.time()
+        dt = datetime.utcfromtimestamp(now)
         key, secret = self.__get_token()
-        return {
-            'Authorization': self.__fn_sign(
+        url_path = url.split('?', 1)[0]
+        if body is None and method == 'GET':
+            authorization = self.__fn_sign_get(key, secret, url_path, dt)
+        else:
+            content_md5 = hashlib.new('md5', body).hexdigest() if body else ''
+            authorization = self.__fn_sign(
                 key,
                 secret,
-                url,
-                content,
+                url_path,
+                content_md5,
                 method,
                 'application/json',
-                dt),
+                dt)
+        return {
+            'Authorization': authorization,
             'Content-Type': 'application/json',
-            'Date': dt.strftime('%a, %d %b %Y %H:%M:%S GMT'),
+            'Date': formatdate(now, usegmt=True),
         }
 
+    def __get_json(self, url: str, key: Optional[str],
+                   error: str) -> Optional[Dict]:
+        """__get_json will make a signed GET request and return the decoded
+        response, memoized by hostname and url until a new sequence revision
+        is created. Cached objects are shared between callers and must not be
+        modified.
+
+        Arguments:
+            url {str} -- Url to make the request
+
+            key {Optional[str]} -- Key of the response to return, or None
+            for the whole response
+
+            error {str} -- Message printed if the request fails
+
+        Returns:
+            Optional[Dict] -- Response
+        """
+        cache_key = self.hostname + url
+        if cache_key in self._get_cache:
+            return self._get_cache[cache_key]
+
+        headers = self.__get_headers(None, url, 'GET')
+        r = None
+        try:
+            r = self._session.get(self.hostname + url, headers=headers,
+                                  timeout=30)
+            r.raise_for_status()
+            response = _loads(r.content)
+        except (requests.exceptions.RequestException, ValueError) as err:
+            if r is not None and r.status_code == 401:
+                print('Your token has been revoked')
+            else:
+                print(error, err)
+            return None
+
+        if key is not None:
+            response = response.get(key)
+        if response is not None:
+            self._get_cache[cache_key] = response
+        return response
+
     def reset(self):
         """reset will reset the user info
         """
@@ -180,6 +309,22 @@ class flix:
         self.login = None
         self.password = None
         self.key = None
+        self._refresh_after = 0.0
+        self._token = None
+        self._token_lock = threading.Lock()
+        self._get_cache = {}
+        self._basic_auth_header = None
+        self._basic_auth_credentials = None
+        self._hmac_cache = None
+        self._session = requests.Session()
+        self._session.verify = False
+        self._session.headers['Content-Type'] = 'application/json'
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16,
+                              max_retries=Retry(
+                                  total=3, backoff_factor=0.2,
+                                  status_forcelist=[502, 503, 504]))
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
 
     # Returns sequence revision by given ID
     def get_sequence_revision_by_id(self,
@@ -203,33 +348,15 @@ class flix:
             Dict -- Sequence revision
         """
 
-        url = '/show/{0}/sequence/{1}/revision/{2}'.format(
-            show_id, sequence_id, revision_id)
         if episode_id is not None:
-            url = '/show/{0}/episode/{1}/sequence/{2}/revision/{3}'.format(
-                show_id, episode_id, sequence_id, revision_id)
-
-        headers = self.__get_headers(None, url, 'GET')
-        response = None
-
-        try:
-            r = requests.get(self.hostname + url, headers=headers,
-                             verify=False)
-            response = json.loads(r.content)
-
-            if r.status_code == 404:
-                print('Could not retrieve sequence revision',
-                      response.get('message'))
-                return None
-
-        except requests.exceptions.RequestException as err:
-            if r is not None and r.status_code == 401:
-                print('Your token has been revoked')
-            else:
-                print('Could not retrieve sequence revision', err)
-            return None
+            url = (f'/show/{show_id}/episode/{episode_id}'
+                   f'/sequence/{sequence_id}/revision/{revision_id}')
+        else:
+            url = (f'/show/{show_id}/sequence/{sequence_id}'
+                   f'/revision/{revision_id}')
 
-        return response
+        return self.__get_json(url, None,
+                               'Could not retrieve sequence revision')
 
     # Returns the list of panels in the sequence revision
     def get_sequence_revision_panels(self,
@@ -252,33 +379,15 @@ class flix:
         Returns:
             Dict -- Panels
         """
-        url = '/show/{0}/sequence/{1}/revision/{2}/panels'.format(
-            show_id, sequence_id, revision_id)
         if episode_id is not None:
-            url = '/show/{0}/episode/{1}/sequence/{2}/revision/{3}/panels'.format(
-                show_id, episode_id, sequence_id, revision_id)
-
-        headers = self.__get_headers(None, url, 'GET')
-        response = None
-
-        try:
-            r = requests.get(self.hostname + url, headers=headers,
-                             verify=False)
-            response = json.loads(r.content)
-            response = response.get('panels')
-
-            if r.status_code == 404:
-                print('Could not retrieve sequence revision panels',
-                      response.get('message'))
-                return None
+            url = (f'/show/{show_id}/episode/{episode_id}'
+                   f'/sequence/{sequence_id}/revision/{revision_id}/panels')
+        else:
+            url = (f'/show/{show_id}/sequence/{sequence_id}'
+                   f'/revision/{revision_id}/panels')
 
-        except requests.exceptions.RequestException as err:
-            if r is not None and r.status_code == 401:
-                print('Your token has been revoked')
-            else:
-                print('Could not retrieve sequence revision panels', err)
-            return None
-        return response
+        return self.__get_json(
+            url, 'panels', 'Could not retrieve sequence revision panels')
 
     # Returns list of dialogues in the panel
     def get_panel_dialogues(self,
@@ -301,43 +410,68 @@ class flix:
         Returns:
             Dict -- Dialogues
         """
-        url = '/show/{0}/sequence/{1}/panel/{2}/dialogues'.format(
-            show_id, sequence_id, panel_id)
         if episode_id is not None:
-            url = '/show/{0}/episode/{1}/sequence/{2}/panel/{3}/dialogues'.format(
-                show_id, episode_id, sequence_id, panel_id)
+            url = (f'/show/{show_id}/episode/{episode_id}'
+                   f'/sequence/{sequence_id}/panel/{panel_id}/dialogues')
+        else:
+            url = (f'/show/{show_id}/sequence/{sequence_id}'
+                   f'/panel/{panel_id}/dialogues')
+
+        return self.__get_json(url, 'dialogues',
+                               'Could not retrieve panel dialogues')
+
+    # Returns dialogues for many panels, fetched concurrently
+    def get_panel_dialogues_bulk(self,
+                                 show_id: int,
+                                 episode_id: int,
+                                 sequence_id: int,
+                                 panel_ids: List[int],
+                                 max_workers: int = 16
+                                 ) -> Dict[int, Optional[List[Dict]]]:
+        """get_panel_dialogues_bulk retrieves the dialogues of every given
+        panel ID using a pool of threads
 
-        headers = self.__get_headers(None, url, 'GET')
-        response = None
+        Arguments:
+            show_id {int} -- Show ID
 
-        try:
-            r = requests.get(self.hostname + url, headers=headers,
-                             verify=False)
-            response = json.loads(r.content)
-            response = response.get('dialogues')
+            episode_id {int} -- Episode ID
+
+            sequence_id {int} -- Sequence ID
 
-            if r.status_code == 404:
-                print('Could not retrieve panel dialogues',
-                      response.get('message'))
-                return None
+            panel_ids {List[int]} -- Panel IDs
 
-        except requests.exceptions.RequestException as err:
-            if r is not None and r.status_code == 401:
-                print('Your token has been revoked')
-            else:
-                print('Could not retrieve panel dialogues', err)
-            return None
-        return response
+            max_workers {int} -- Number of concurrent requests
+            (default: {16})
+
+        Returns:
+            Dict[int, Optional[List[Dict]]] -- Dialogues by panel ID, None
+            for panels whose dialogues could not be retrieved
+        """
+        # Refresh the token up front so workers rarely need to
+        self.__get_token()
+        dialogues = {}
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.get_panel_dialogues, show_id,
+                                episode_id, sequence_id, panel_id): panel_id
+                for panel_id in panel_ids
+            }
+            for future in concurrent.futures.as_completed(futures):
+                dialogues[futures[future]] = future.result()
+        return dialogues
 
     # Returns formatted panel object as revisioned panels for POST request
     def format_panel_for_revision(self, panel: Dict, dialogue: Dict) -> Dict:
-        """format_panel_for_revision will format the panels as revisioned panels
+        """format_panel_for_revision will format a panel as a revisioned panel
 
         Arguments:
-            panels {List} -- List of panels
+            panel {Dict} -- Panel
+
+            dialogue {Dict} -- Dialogue to link to the panel
 
         Returns:
-            List -- Formatted list of panels
+            Dict -- Formatted panel
         """
         revisioned_panel = {
             'dialogue': dialogue,
@@ -347,6 +481,32 @@ class flix:
         }
         return revisioned_panel
 
+    # Returns formatted panel objects as revisioned panels for POST request
+    def format_panels_for_revision(self,
+                                   panels: List[Dict],
+                                   dialogues: List[Dict]
+                                   ) -> List[Dict]:
+        """format_panels_for_revision will format the panels as revisioned
+        panels
+
+        Arguments:
+            panels {List[Dict]} -- List of panels
+
+            dialogues {List[Dict]} -- Dialogue to link to each panel
+
+        Returns:
+            List[Dict] -- Formatted list of panels
+        """
+        try:
+            fields = list(map(_revision_fields, panels))
+        except KeyError:
+            return [self.format_panel_for_revision(p, d)
+                    for p, d in zip(panels, dialogues)]
+        return [{'dialogue': dialogue, 'duration': duration, 'id': panel_id,
+                 'revision_number': revision_number}
+                for dialogue, (duration, panel_id, revision_number)
+                in zip(dialogues, fields)]
+
     # Makes POST request to create a new sequence revision
     def create_new_sequence_revision(
             self, show_id: int, episode_id: int, sequence_id: int, revisioned_panels: List[Dict], revision: Dict,
@@ -373,10 +533,11 @@ class flix:
         if not comment:
             comment = 'Auto Dialogue Relink'
 
-        url = '/show/{0}/sequence/{1}/revision'.format(show_id, sequence_id)
         if episode_id is not None:
-            url = '/show/{0}/episode/{1}/sequence/{2}/revision'.format(
-                show_id, episode_id, sequence_id)
+            url = (f'/show/{show_id}/episode/{episode_id}'
+                   f'/sequence/{sequence_id}/revision')
+        else:
+            url = f'/show/{show_id}/sequence/{sequence_id}/revision'
 
         meta = revision.get('meta_data', {})
 
@@ -394,15 +555,19 @@ class flix:
             'revisioned_panels': revisioned_panels
         }
 
-        headers = self.__get_headers(content, url, 'POST')
+        body = _dumps(content)
+        headers = self.__get_headers(body, url, 'POST')
 
         response = None
         try:
-            r = requests.post(self.hostname + url, headers=headers,
-                              data=json.dumps(content), verify=False)
-            response = json.loads(r.content)
+            r = self._session.post(self.hostname + url, headers=headers,
+                                   data=body, timeout=60)
+            r.raise_for_status()
+            response = _loads(r.content)
 
-        except BaseException:
-            print('Could not create sequence revision')
+        except (requests.exceptions.RequestException, ValueError) as err:
+            print('Could not create sequence revision', err)
             return None
+        # The server state changed, previously fetched data may be stale
+        self._get_cache.clear()
         return response
@@ -3,9 +3,6 @@
 #
 
 import argparse
-import datetime
-import os
-import signal
 import sys
 import flix as flix_api
 
@@ -28,22 +25,26 @@ def start_relink(show_id, episode_id, sequence_id, revision_id, comment):
         print('Panels not found.')
         sys.exit(1)
 
-    revisioned_panels = []
+    # Get dialogues for all panels at once
+    panel_dialogues = flix_api.get_panel_dialogues_bulk(
+        show_id, episode_id, sequence_id, [p.get("panel_id") for p in panels])
 
-    # Loop through panels and get dialogues for each
-    # Select the latest dialogue
-    for p in panels:
-        dialogues = flix_api.get_panel_dialogues(
-            show_id, episode_id, sequence_id, p.get("panel_id"))
+    if any(d is None for d in panel_dialogues.values()):
+        print('Dialogues not found for every panel.')
+        sys.exit(1)
 
+    # Select the latest dialogue for each panel
+    dialogues = []
+    for p in panels:
+        panel_dialogue = panel_dialogues[p.get("panel_id")]
         dialogue = None
-        if len(dialogues):
-            dialogue = {'id': dialogues[0].get(
+        if len(panel_dialogue):
+            dialogue = {'id': panel_dialogue[0].get(
                 'dialogue_id'), 'text': ""}
+        dialogues.append(dialogue)
 
-        # Creates json object for each panel to POST
-        formatted_panel = flix_api.format_panel_for_revision(p, dialogue)
-        revisioned_panels.append(formatted_panel)
+    # Creates json object for each panel to POST
+    revisioned_panels = flix_api.format_panels_for_revision(panels, dialogues)
 
     # Sends POST request to create a new sequence revision with correct panels and dialogues
     new_revision = flix_api.create_new_sequence_revision(